@@ -276,11 +276,17 @@ if not "DISCORD_API_TOKEN" in os.environ:
     )
     CHAT_DEFAULT_SERVICE = None
     CHAT_SERVICES = {}
+    CHAT_ASYNC_SERVICES = {}
 else:
     CHAT_DEFAULT_SERVICE = "DISCORD"
     CHAT_SERVICES = {
         "DISCORD": discord_lib.DiscordChatService,
     }
+    # Optional asyncio implementations, keyed like CHAT_SERVICES. ChatRoom uses
+    # these for bulk channel operations such as createhuntchannels.
+    CHAT_ASYNC_SERVICES = {
+        "DISCORD": discord_lib.AsyncDiscordChatService,
+    }
 
 
 # Celery settings
@@ -9,9 +9,10 @@ class FakeChatService(ChatService):
         self.category_to_channel = dict()
         self.messages = set()
 
-    def create_text_channel(self, guild_id, name, *args, **kwargs):
+    def create_text_channel(self, guild_id, name, text_category_name="text"):
         channel_id = name + "-text"
         self.text_channels.add(channel_id)
+        self.categorize_channel(guild_id, channel_id, text_category_name)
         return channel_id
 
     def create_audio_channel(self, guild_id, name, *args, **kwargs):
@@ -27,14 +28,17 @@ class FakeChatService(ChatService):
 
     def archive_channel(self, guild_id, channel_id, *args, **kwargs):
         self.archived_channels.add(channel_id)
+        return True
 
     def unarchive_text_channel(self, guild_id, channel_id, *args, **kwargs):
         if channel_id in self.archived_channels:
             self.archived_channels.remove(channel_id)
+        return True
 
     def unarchive_voice_channel(self, guild_id, channel_id, *args, **kwargs):
         if channel_id in self.archived_channels:
             self.archived_channels.remove(channel_id)
+        return True
 
     def categorize_channel(self, guild_id, channel_id, category_name):
         if channel_id in self.archived_channels:
@@ -51,9 +55,34 @@ class FakeChatService(ChatService):
             self.category_to_channel[category_name] = set()
 
         self.category_to_channel[category_name].add(channel_id)
+        return True
 
     def create_channel_url(self, guild_id, channel_id, is_audio=False):
         return ""
 
-    def send_message(self, channel_id, msg, embedded_urls={}):
+    def send_message(self, channel_id, msg, embedded_urls=None):
         self.messages.add(msg)
+
+
+class FakeAsyncChatService:
+    """asyncio counterpart of FakeChatService, sharing its state."""
+
+    def __init__(self, django_settings):
+        self.sync_service = FakeChatService.get_instance()
+        self.closed = False
+
+    @classmethod
+    def get_instance(cls):
+        return cls(None)
+
+    async def create_text_channel(self, guild_id, name, text_category_name="text"):
+        return self.sync_service.create_text_channel(guild_id, name, text_category_name)
+
+    def create_channel_url(self, guild_id, channel_id, is_audio=False):
+        return self.sync_service.create_channel_url(guild_id, channel_id, is_audio)
+
+    async def send_message(self, channel_id, msg, embedded_urls=None):
+        self.sync_service.send_message(channel_id, msg, embedded_urls)
+
+    async def close(self):
+        self.closed = True
@@ -0,0 +1,56 @@
+import asyncio
+
+from django.core.management.base import BaseCommand, CommandError
+
+from chat.models import ChatRoom
+
+
+async def _send_created_messages(rooms, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send_created_message(room):
+        async with semaphore:
+            await room.asend_message(
+                f"**{room.puzzle.name}** has been created!",
+                room.puzzle.create_field_url_map(),
+            )
+
+    try:
+        await asyncio.gather(*[send_created_message(room) for room in rooms])
+    finally:
+        for service in {room.async_service_instance for room in rooms}:
+            if service is not None:
+                await service.close()
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates chat channels for every puzzle in a hunt that doesn't have them yet."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("hunt_slug")
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=10,
+            help="Maximum number of puzzles to create channels for at once.",
+        )
+
+    def handle(self, *args, **options):
+        concurrency = options["concurrency"]
+        if concurrency < 1:
+            raise CommandError("--concurrency must be at least 1")
+
+        rooms = list(
+            ChatRoom.objects.for_bulk_ops().filter(
+                puzzle__hunt__slug=options["hunt_slug"],
+                puzzle__deleted_at__isnull=True,
+                text_channel_id__isnull=True,
+            )
+        )
+        created_rooms = ChatRoom.bulk_create_channels(rooms, concurrency)
+        asyncio.run(_send_created_messages(created_rooms, concurrency))
+        self.stdout.write(
+            f"Created channels for {len(created_rooms)}/{len(rooms)} puzzles"
+        )
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.18 on 2026-10-14 14:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0011_puzzles_soft_delete"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatroom",
+            name="text_channel_category",
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
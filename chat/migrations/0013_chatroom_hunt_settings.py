@@ -0,0 +1,23 @@
+# Generated by Django 4.2.18 on 2026-10-14 14:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0012_chatroom_text_channel_category"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="chatroom",
+            name="announcements_channel_id",
+            field=models.CharField(blank=True, max_length=128, null=True),
+        ),
+        migrations.AddField(
+            model_name="chatroom",
+            name="guild_id",
+            field=models.CharField(blank=True, max_length=128, null=True),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.18 on 2026-10-14 16:20
+
+from django.db import migrations
+
+
+# Copies each existing room's hunt chat settings onto it, so rooms created
+# before 0013 don't keep loading their puzzle's hunt settings.
+def copy_hunt_settings(apps, schema_editor):
+    ChatRoom = apps.get_model("chat", "ChatRoom")
+    rooms = ChatRoom.objects.filter(
+        guild_id__isnull=True, puzzle__hunt__settings__isnull=False
+    ).select_related("puzzle__hunt__settings")
+    updated_rooms = []
+    for room in rooms.iterator(chunk_size=500):
+        hunt_settings = room.puzzle.hunt.settings
+        room.guild_id = hunt_settings.discord_guild_id
+        room.announcements_channel_id = (
+            hunt_settings.discord_puzzle_announcements_channel_id
+        )
+        updated_rooms.append(room)
+    ChatRoom.objects.bulk_update(
+        updated_rooms, ["guild_id", "announcements_channel_id"], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("chat", "0013_chatroom_hunt_settings"),
+        ("hunts", "0017_alter_hunt_options"),
+        ("puzzles", "0035_puzzles_soft_delete"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            copy_hunt_settings,
+            reverse_code=migrations.RunPython.noop,
+        )
+    ]
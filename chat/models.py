@@ -1,16 +1,77 @@
+import asyncio
+import logging
+from functools import cached_property, lru_cache
+
+from asgiref.sync import async_to_sync, sync_to_async
 from django.conf import settings
+from django.core.signals import setting_changed
 from django.db import models
+from django.db.models import Prefetch
 from django.dispatch import receiver
+from django_softdelete.managers import SoftDeleteManager
 from django_softdelete.models import SoftDeleteModel
 
+from puzzles.models import Puzzle
 from puzzles.puzzle_tag import PuzzleTag
 
+logger = logging.getLogger(__name__)
+
 
 def _get_default_service():
     return settings.CHAT_DEFAULT_SERVICE
 
 
 SERVICE_CHOICES = ["DISCORD"]
+SERVICE_CHOICE_TUPLES = tuple((service, service) for service in SERVICE_CHOICES)
+
+
+_DEFAULT_SERVICE_INSTANCE = None
+
+
+def _default_service():
+    global _DEFAULT_SERVICE_INSTANCE
+    if _DEFAULT_SERVICE_INSTANCE is None:
+        _DEFAULT_SERVICE_INSTANCE = settings.CHAT_SERVICES[
+            settings.CHAT_DEFAULT_SERVICE
+        ].get_instance()
+    return _DEFAULT_SERVICE_INSTANCE
+
+
+@lru_cache(maxsize=len(SERVICE_CHOICES))
+def _resolve_service(name):
+    return settings.CHAT_SERVICES[name].get_instance()
+
+
+@lru_cache(maxsize=len(SERVICE_CHOICES))
+def _resolve_async_service(name):
+    async_services = getattr(settings, "CHAT_ASYNC_SERVICES", {})
+    if name not in async_services:
+        return None
+    return async_services[name].get_instance()
+
+
+@receiver(setting_changed)
+def _clear_resolved_services(setting, **kwargs):
+    global _DEFAULT_SERVICE_INSTANCE
+    if setting in ("CHAT_SERVICES", "CHAT_DEFAULT_SERVICE"):
+        _DEFAULT_SERVICE_INSTANCE = None
+        _resolve_service.cache_clear()
+    elif setting == "CHAT_ASYNC_SERVICES":
+        _resolve_async_service.cache_clear()
+
+
+class ChatRoomManager(SoftDeleteManager):
+    def for_bulk_ops(self):
+        """
+        ChatRooms with everything their channel operations read already loaded,
+        for code that operates on many rooms at once.
+        """
+        return self.select_related("puzzle__hunt__settings").prefetch_related(
+            Prefetch(
+                "puzzle__metas",
+                queryset=Puzzle.objects.order_by("created_on"),
+            )
+        )
 
 
 class ChatRoom(SoftDeleteModel):
@@ -45,25 +106,68 @@ class ChatRoom(SoftDeleteModel):
 
     service = models.CharField(
         max_length=32,
-        choices=[(service, service) for service in SERVICE_CHOICES],
+        choices=SERVICE_CHOICE_TUPLES,
         default=_get_default_service,
     )
     name = models.CharField(max_length=255)
 
     text_channel_id = models.CharField(max_length=255, null=True, blank=True)
     text_channel_url = models.URLField(null=True, blank=True)
+    # Last category the text channel was placed in, so unchanged categories
+    # don't cost a round-trip to the chat service.
+    text_channel_category = models.CharField(max_length=255, null=True, blank=True)
 
     audio_channel_url = models.URLField(null=True, blank=True)
     audio_channel_id = models.CharField(max_length=255, null=True, blank=True)
 
+    # Copies of the hunt's chat settings, saved when channels are created so that
+    # channel operations don't need to load the puzzle's hunt settings. Kept in
+    # sync by update_chat_room_hunt_settings below; None until first populated.
+    guild_id = models.CharField(max_length=128, null=True, blank=True)
+    announcements_channel_id = models.CharField(max_length=128, null=True, blank=True)
+
+    objects = ChatRoomManager()
+
     def __str__(self):
         return self.name
 
+    @cached_property
+    def service_instance(self):
+        if self.service == settings.CHAT_DEFAULT_SERVICE:
+            return _default_service()
+        return _resolve_service(self.service)
+
     def get_service(self):
-        return settings.CHAT_SERVICES[self.service].get_instance()
+        return self.service_instance
+
+    @cached_property
+    def async_service_instance(self):
+        """Async counterpart of service_instance, or None if none is registered."""
+        return _resolve_async_service(self.service)
 
     def get_guild_id(self):
-        return self.puzzle.hunt.settings.discord_guild_id
+        if self.guild_id is None:
+            return self.puzzle.hunt.settings.discord_guild_id
+        return self.guild_id
+
+    def get_announcements_channel_id(self):
+        if self.announcements_channel_id is None:
+            return self.puzzle.hunt.settings.discord_puzzle_announcements_channel_id
+        return self.announcements_channel_id
+
+    def _populate_hunt_settings(self):
+        """
+        Copies the hunt's chat settings onto this room if they haven't been yet.
+        Returns the names of the fields that changed.
+        """
+        if self.guild_id is not None and self.announcements_channel_id is not None:
+            return []
+        hunt_settings = self.puzzle.hunt.settings
+        self.guild_id = hunt_settings.discord_guild_id
+        self.announcements_channel_id = (
+            hunt_settings.discord_puzzle_announcements_channel_id
+        )
+        return ["guild_id", "announcements_channel_id"]
 
     def _get_category_name(self):
         if self.puzzle.is_solved():
@@ -72,11 +176,19 @@ class ChatRoom(SoftDeleteModel):
         if self.puzzle.is_meta:
             return self.puzzle.hunt.settings.discord_metas_category
 
-        metas = self.puzzle.metas.order_by("created_on").all()
-        if len(metas) > 0:
-            return metas[0].name  # default to the oldest created meta
-        else:
-            None
+        # default to the oldest created meta
+        first_meta = self._get_first_meta()
+        if first_meta is not None:
+            return first_meta.name
+        return None
+
+    def _get_first_meta(self):
+        if "metas" in getattr(self.puzzle, "_prefetched_objects_cache", {}):
+            # Don't bypass metas prefetched by the caller with a new query.
+            return min(
+                self.puzzle.metas.all(), key=lambda m: m.created_on, default=None
+            )
+        return self.puzzle.metas.order_by("created_on").first()
 
     def _get_text_category_name(self):
         return (
@@ -90,17 +202,42 @@ class ChatRoom(SoftDeleteModel):
             or self.puzzle.hunt.settings.discord_unassigned_voice_category
         )
 
-    def create_channels(self):
-        service = self.get_service()
-        update_fields = []
+    # Fields that creating channels may change, for bulk updates.
+    CHANNEL_FIELDS = (
+        "guild_id",
+        "announcements_channel_id",
+        "text_channel_id",
+        "text_channel_url",
+        "text_channel_category",
+    )
+
+    def _set_text_channel(self, service, channel_id, category_name):
+        """
+        Sets the fields for a newly created text channel without saving. Returns
+        the names of the fields that changed.
+        """
+        self.text_channel_id = channel_id
+        self.text_channel_url = service.create_channel_url(
+            self.get_guild_id(), channel_id, is_audio=False
+        )
+        self.text_channel_category = category_name
+        return ["text_channel_id", "text_channel_url", "text_channel_category"]
+
+    def _populate_channels_fields(self):
+        """
+        Creates any missing channels and sets their fields on this room without
+        saving. Returns the names of the fields that changed.
+        """
+        service = self.service_instance
+        update_fields = self._populate_hunt_settings()
         if self.text_channel_id is None:
-            self.text_channel_id = service.create_text_channel(
-                self.get_guild_id(), self.name, self._get_text_category_name()
+            text_category_name = self._get_text_category_name()
+            channel_id = service.create_text_channel(
+                self.get_guild_id(), self.name, text_category_name
             )
-            self.text_channel_url = service.create_channel_url(
-                self.get_guild_id(), self.text_channel_id, is_audio=False
+            update_fields.extend(
+                self._set_text_channel(service, channel_id, text_category_name)
             )
-            update_fields.extend(["text_channel_id", "text_channel_url"])
 
         '''if self.audio_channel_id is None:
             self.audio_channel_id = service.create_audio_channel(
@@ -111,28 +248,101 @@ class ChatRoom(SoftDeleteModel):
             )
             update_fields.extend(["audio_channel_id", "audio_channel_url"])'''
 
-        self.save(update_fields=update_fields)
+        return update_fields
+
+    async def _apopulate_channels_fields(self):
+        """Async version of _populate_channels_fields.
+
+        Must only be called once the puzzle, its hunt settings and metas are
+        loaded (e.g. via ChatRoom.objects.for_bulk_ops()), since reading them
+        here can't hit the database.
+        """
+        service = self.async_service_instance
+        if service is None:
+            return await sync_to_async(self._populate_channels_fields)()
+
+        update_fields = self._populate_hunt_settings()
+        if self.text_channel_id is None:
+            text_category_name = self._get_text_category_name()
+            channel_id = await service.create_text_channel(
+                self.get_guild_id(), self.name, text_category_name
+            )
+            update_fields.extend(
+                self._set_text_channel(service, channel_id, text_category_name)
+            )
+        return update_fields
+
+    def create_channels(self):
+        update_fields = self._populate_channels_fields()
+        if update_fields:
+            self.save(update_fields=update_fields)
+
+    @classmethod
+    def bulk_create_channels(cls, rooms, concurrency=10):
+        """
+        Creates missing channels for many rooms concurrently, then saves them all
+        with bulk_update. rooms should be loaded with
+        ChatRoom.objects.for_bulk_ops(). Returns the rooms that were updated.
+        """
+        updated_rooms = async_to_sync(cls._apopulate_rooms_channels_fields)(
+            rooms, concurrency
+        )
+        cls.objects.bulk_update(updated_rooms, cls.CHANNEL_FIELDS, batch_size=100)
+        return updated_rooms
+
+    @staticmethod
+    async def _apopulate_rooms_channels_fields(rooms, concurrency):
+        # Bounds in-flight rooms so bulk setup stays well under Discord's global
+        # rate limit of 50 requests per second.
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def populate(room):
+            try:
+                async with semaphore:
+                    return bool(await room._apopulate_channels_fields())
+            except Exception as e:
+                logger.exception(f"Creating channels for {room.name} failed: {e}")
+                return False
+
+        try:
+            results = await asyncio.gather(*[populate(room) for room in rooms])
+        finally:
+            for service in {room.async_service_instance for room in rooms}:
+                if service is not None:
+                    await service.close()
+        return [room for room, updated in zip(rooms, results) if updated]
 
     def archive_channels(self):
-        service = self.get_service()
+        service = self.service_instance
         archive_category = self.puzzle.hunt.settings.discord_archive_category
         if self.text_channel_id:
-            service.archive_channel(
+            if service.archive_channel(
                 self.get_guild_id(), self.text_channel_id, archive_category
-            )
+            ):
+                self._set_text_channel_category(archive_category)
         if self.audio_channel_id:
             service.archive_channel(
                 self.get_guild_id(), self.audio_channel_id, archive_category
             )
 
+    def _set_text_channel_category(self, category_name):
+        if self.text_channel_category != category_name:
+            self.text_channel_category = category_name
+            self.save(update_fields=["text_channel_category"])
+
     def update_category(self):
-        service = self.get_service()
+        service = self.service_instance
         if self.text_channel_id:
-            service.categorize_channel(
-                self.get_guild_id(),
-                self.text_channel_id,
-                self._get_text_category_name(),
-            )
+            text_category_name = self._get_text_category_name()
+            if text_category_name != self.text_channel_category:
+                # Only record categories the channel actually moved to, so a
+                # failed move is retried next time.
+                if service.categorize_channel(
+                    self.get_guild_id(),
+                    self.text_channel_id,
+                    text_category_name,
+                ):
+                    self._set_text_channel_category(text_category_name)
         if self.audio_channel_id:
             service.categorize_channel(
                 self.get_guild_id(),
@@ -141,13 +351,15 @@ class ChatRoom(SoftDeleteModel):
             )
 
     def unarchive_channels(self):
-        service = self.get_service()
+        service = self.service_instance
         if self.text_channel_id:
-            service.unarchive_text_channel(
+            text_category_name = self._get_text_category_name()
+            if service.unarchive_text_channel(
                 self.get_guild_id(),
                 self.text_channel_id,
-                self._get_text_category_name(),
-            )
+                text_category_name,
+            ):
+                self._set_text_channel_category(text_category_name)
         if self.audio_channel_id:
             service.unarchive_voice_channel(
                 self.get_guild_id(),
@@ -156,7 +368,7 @@ class ChatRoom(SoftDeleteModel):
             )
 
     def delete_channels(self, check_if_used=False):
-        service = self.get_service()
+        service = self.service_instance
         update_fields = []
 
         if self.audio_channel_id:
@@ -183,49 +395,69 @@ class ChatRoom(SoftDeleteModel):
             service.delete_text_channel(self.text_channel_id)
             self.text_channel_id = None
             self.text_channel_url = ""
-            update_fields.extend(["text_channel_id", "text_channel_url"])
+            self.text_channel_category = None
+            update_fields.extend(
+                ["text_channel_id", "text_channel_url", "text_channel_category"]
+            )
 
         if update_fields:
             self.save(update_fields=update_fields)
 
-    def send_message(self, msg, embedded_urls={}):
+    def send_message(self, msg, embedded_urls=None):
         """
         Sends msg to text channel.
         embedded_urls is a map mapping display_text to url.
         e.g. { "Join voice channel": "https://discord.gg/XXX" }
         """
         if self.text_channel_id:
-            service = self.get_service()
+            service = self.service_instance
             service.send_message(self.text_channel_id, msg, embedded_urls)
 
+    async def asend_message(self, msg, embedded_urls=None):
+        """Async version of send_message."""
+        if not self.text_channel_id:
+            return
+        service = self.async_service_instance
+        if service is None:
+            await sync_to_async(self.send_message)(msg, embedded_urls)
+            return
+        await service.send_message(self.text_channel_id, msg, embedded_urls)
+
     def send_and_announce_message(self, msg):
-        self.get_service().announce(
-            self.puzzle.hunt.settings.discord_puzzle_announcements_channel_id, msg
-        )
-        self.send_message(msg)
+        service = self.service_instance
+        service.announce(self.get_announcements_channel_id(), msg)
+        if self.text_channel_id:
+            service.send_message(self.text_channel_id, msg)
 
     def send_and_announce_message_with_embedded_urls(self, msg, puzzle):
+        announcements_id = self.get_announcements_channel_id()
+        if not announcements_id:
+            self.send_message_with_embedded_urls(msg, puzzle)
+            return
+
         embedded_urls = {}
         if puzzle:
             embedded_urls = puzzle.create_field_url_map()
-        self.get_service().announce(
-            self.puzzle.hunt.settings.discord_puzzle_announcements_channel_id,
-            msg,
-            embedded_urls,
-        )
-        self.send_message(msg, embedded_urls)
+
+        service = self.service_instance
+        service.announce(announcements_id, msg, embedded_urls)
+        if self.text_channel_id:
+            service.send_message(self.text_channel_id, msg, embedded_urls)
 
     def announce_message_with_embedded_urls(self, msg, puzzle):
+        announcements_id = self.get_announcements_channel_id()
+        if not announcements_id:
+            return
+
         embedded_urls = {}
         if puzzle:
             embedded_urls = puzzle.create_field_url_map()
-        self.get_service().announce(
-            self.puzzle.hunt.settings.discord_puzzle_announcements_channel_id,
-            msg,
-            embedded_urls,
-        )
+        self.service_instance.announce(announcements_id, msg, embedded_urls)
 
     def send_message_with_embedded_urls(self, msg, puzzle):
+        if not self.text_channel_id:
+            return
+
         embedded_urls = {}
         if puzzle:
             embedded_urls = puzzle.create_field_url_map()
@@ -236,21 +468,21 @@ class ChatRoom(SoftDeleteModel):
             self.send_message(f"This puzzle was marked {tag_name}")
             return
         # Any service-specific logic should go in the handler below
-        self.get_service().handle_tag_added(
-            self.puzzle.hunt.settings.discord_puzzle_announcements_channel_id,
+        self.service_instance.handle_tag_added(
+            self.get_announcements_channel_id(),
             puzzle,
             tag_name,
         )
 
     def handle_tag_removed(self, puzzle, tag_name):
-        self.get_service().handle_tag_removed(
-            self.puzzle.hunt.settings.discord_puzzle_announcements_channel_id,
+        self.service_instance.handle_tag_removed(
+            self.get_announcements_channel_id(),
             puzzle,
             tag_name,
         )
 
     def handle_puzzle_rename(self, new_name):
-        service = self.get_service()
+        service = self.service_instance
         service.handle_puzzle_rename(self.text_channel_id, new_name)
         #service.handle_puzzle_rename(self.audio_channel_id, new_name)
 
@@ -263,7 +495,7 @@ class ChatRole(models.Model):
     )
     service = models.CharField(
         max_length=32,
-        choices=[(service, service) for service in SERVICE_CHOICES],
+        choices=SERVICE_CHOICE_TUPLES,
         default=_get_default_service,
     )
 
@@ -274,6 +506,21 @@ class ChatRole(models.Model):
         return self.name
 
 
+@receiver(models.signals.post_save, sender="hunts.HuntSettings")
+def update_chat_room_hunt_settings(sender, instance, created, **kwargs):
+    if created:
+        return
+    ChatRoom.objects.filter(
+        puzzle__hunt_id=instance.hunt_id, guild_id__isnull=False
+    ).update(
+        guild_id=instance.discord_guild_id,
+        announcements_channel_id=instance.discord_puzzle_announcements_channel_id,
+    )
+
+
 @receiver(models.signals.pre_delete, sender=ChatRoom)
 def delete_chat_room_channels(sender, instance, using, **kwargs):
-    instance.delete_channels()
+    # Rooms without channels have nothing to clean up, so don't resolve their
+    # chat service (which may not even be configured).
+    if instance.text_channel_id or instance.audio_channel_id:
+        instance.delete_channels()
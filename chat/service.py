@@ -44,6 +44,11 @@ class ChatService:
         raise NotImplementedError
 
     def categorize_channel(self, guild_id, channel_id, category_name):
+        """Moves the channel into category_name. Returns whether it was moved.
+
+        archive_channel, unarchive_text_channel and unarchive_voice_channel
+        return the same way.
+        """
         raise NotImplementedError
 
     def archive_channel(self, guild_id, channel_id, *args, **kwargs):
@@ -55,10 +60,10 @@ class ChatService:
     def unarchive_voice_channel(self, guild_id, channel_id, *args, **kwargs):
         raise NotImplementedError
 
-    def send_message(self, channel_id, msg, embedded_urls={}):
+    def send_message(self, channel_id, msg, embedded_urls=None):
         raise NotImplementedError
 
-    def announce(self, channel_id, msg, embedded_urls={}):
+    def announce(self, channel_id, msg, embedded_urls=None):
         raise NotImplementedError
 
     def handle_tag_added(self, channel_id, puzzle, tag_name):
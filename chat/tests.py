@@ -1,9 +1,14 @@
+from io import StringIO
+from unittest.mock import patch
+
+from asgiref.sync import async_to_sync
+from django.core.management import CommandError, call_command
 from django.test import TestCase, override_settings
 
 from hunts.models import Hunt
 from puzzles.models import Puzzle
 
-from .fake_service import FakeChatService
+from .fake_service import FakeAsyncChatService, FakeChatService
 from .models import ChatRoom
 from .service import ChatService
 
@@ -52,6 +57,10 @@ class TestChatRoom(TestCase):
     def test_chat_room_service(self):
         self.assertEqual(self.room.service, "FAKE")
 
+    def test_chat_room_service_instance_is_resolved_service(self):
+        self.assertIs(self.room.service_instance, self.fake_service)
+        self.assertIs(self.room.get_service(), self.fake_service)
+
     def test_chat_room_create_channels_based_on_name(self):
         self.room.create_channels()
         self.assertIn(self.room.text_channel_id, self.fake_service.text_channels)
@@ -69,6 +78,11 @@ class TestChatRoom(TestCase):
         self.assertNotIn(self.room.text_channel_id, self.fake_service.text_channels)
         self.assertNotIn(self.room.audio_channel_id, self.fake_service.audio_channels)
 
+    def test_hard_delete_without_channels_skips_service(self):
+        room = ChatRoom.objects.create(name="Unconfigured Room", service="DISCORD")
+        room.hard_delete()
+        self.assertFalse(ChatRoom.global_objects.filter(pk=room.pk).exists())
+
     def test_chat_room_archive_and_unarchive(self):
         self.room.create_channels()
         self.room.archive_channels()
@@ -164,6 +178,118 @@ class TestChatRoom(TestCase):
             self.fake_service.category_to_channel[self.meta.name],
         )
 
+    def test_update_category_skips_unchanged_category(self):
+        text_category = self.room.puzzle.hunt.settings.discord_unassigned_text_category
+        self.room.create_channels()
+        self.assertEqual(self.room.text_channel_category, text_category)
+
+        with patch.object(self.fake_service, "categorize_channel") as categorize:
+            self.room.update_category()
+        categorize.assert_not_called()
+
+        self.feeder.metas.add(self.meta)
+        self.room.update_category()
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.text_channel_category, self.meta.name)
+        self.assertIn(
+            self.room.text_channel_id,
+            self.fake_service.category_to_channel[self.meta.name],
+        )
+
+    def test_update_category_keeps_category_when_move_fails(self):
+        text_category = self.room.puzzle.hunt.settings.discord_unassigned_text_category
+        self.feeder.chat_room = self.room
+        self.feeder.save()
+        self.room.create_channels()
+        self.feeder.metas.add(self.meta)
+
+        with patch.object(
+            self.fake_service, "categorize_channel", return_value=False
+        ) as categorize:
+            self.room.update_category()
+            self.room.update_category()
+        self.assertEqual(categorize.call_count, 2)
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.text_channel_category, text_category)
+
+        with patch.object(self.fake_service, "archive_channel", return_value=False):
+            self.room.archive_channels()
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.text_channel_category, text_category)
+
+    def test_for_bulk_ops_prefetches_category_lookups(self):
+        self.feeder.chat_room = self.room
+        self.feeder.save()
+        self.meta.chat_room = self.meta_room
+        self.meta.save()
+        self.feeder.metas.add(self.meta)
+        with self.assertNumQueries(2):
+            categories = {
+                room.name: room._get_text_category_name()
+                for room in ChatRoom.objects.for_bulk_ops()
+            }
+        self.assertEqual(categories[self.room.name], self.meta.name)
+        self.assertEqual(
+            categories[self.meta_room.name],
+            self.meta.hunt.settings.discord_metas_category,
+        )
+
+    def test_announce_without_announcements_channel_skips_url_map(self):
+        self.room.create_channels()
+        with patch.object(self.feeder, "create_field_url_map") as url_map:
+            self.room.announce_message_with_embedded_urls("msg", self.feeder)
+        url_map.assert_not_called()
+
+        msg = "no announcements channel"
+        self.room.send_and_announce_message_with_embedded_urls(msg, self.feeder)
+        self.assertIn(msg, self.fake_service.messages)
+
+    def test_create_channels_copies_hunt_settings(self):
+        hunt_settings = self.feeder.hunt.settings
+        hunt_settings.discord_guild_id = "guild"
+        hunt_settings.save()
+        self.feeder.chat_room = self.room
+        self.feeder.save()
+
+        self.room.create_channels()
+        self.assertEqual(self.room.guild_id, "guild")
+        self.assertEqual(self.room.announcements_channel_id, "")
+
+        hunt_settings.discord_puzzle_announcements_channel_id = "announcements"
+        hunt_settings.save()
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.get_announcements_channel_id(), "announcements")
+
+    def test_bulk_create_channels(self):
+        self.feeder.chat_room = self.room
+        self.feeder.save()
+        self.meta.chat_room = self.meta_room
+        self.meta.save()
+
+        rooms = list(ChatRoom.objects.for_bulk_ops())
+        self.assertEqual(len(ChatRoom.bulk_create_channels(rooms)), 2)
+        for room in ChatRoom.objects.all():
+            self.assertIn(room.text_channel_id, self.fake_service.text_channels)
+            self.assertIsNotNone(room.guild_id)
+
+    @override_settings(CHAT_ASYNC_SERVICES={"FAKE": FakeAsyncChatService})
+    def test_bulk_create_channels_uses_async_service(self):
+        self.feeder.chat_room = self.room
+        self.feeder.save()
+
+        rooms = list(ChatRoom.objects.for_bulk_ops().filter(pk=self.room.pk))
+        self.assertEqual(ChatRoom.bulk_create_channels(rooms), rooms)
+        self.room.refresh_from_db()
+        self.assertIn(self.room.text_channel_id, self.fake_service.text_channels)
+        self.assertTrue(rooms[0].async_service_instance.closed)
+
+    @override_settings(CHAT_ASYNC_SERVICES={"FAKE": FakeAsyncChatService})
+    def test_asend_message_uses_async_service(self):
+        self.room.create_channels()
+        msg = "async message"
+        async_to_sync(self.room.asend_message)(msg)
+        self.assertIn(msg, self.fake_service.messages)
+
     def test_send_message_and_announce(self):
         self.room.create_channels()
         msg = self.room.name
@@ -171,6 +297,61 @@ class TestChatRoom(TestCase):
         self.assertIn(msg, self.fake_service.messages)
 
 
+@override_settings(
+    CHAT_DEFAULT_SERVICE="FAKE",
+    CHAT_SERVICES={"FAKE": FakeChatService},
+    CHAT_ASYNC_SERVICES={"FAKE": FakeAsyncChatService},
+)
+class TestCreateHuntChannelsCommand(TestCase):
+    def setUp(self):
+        self.hunt = Hunt.objects.create(name="fake hunt", url="google.com")
+        self.fake_service = FakeChatService.get_instance()
+        self.puzzles = []
+        for i in range(3):
+            puzzle = Puzzle.objects.create(
+                name=f"puzzle {i}",
+                hunt=self.hunt,
+                url=f"url{i}.com",
+                sheet=f"sheet{i}.com",
+                is_meta=False,
+            )
+            puzzle.chat_room = ChatRoom.objects.create(name=puzzle.name)
+            puzzle.save()
+            self.puzzles.append(puzzle)
+
+    def test_creates_missing_channels_and_announces_them(self):
+        existing_room = self.puzzles[0].chat_room
+        existing_room.text_channel_id = "existing"
+        existing_room.save()
+
+        out = StringIO()
+        call_command("createhuntchannels", self.hunt.slug, stdout=out)
+        self.assertIn("Created channels for 2/2 puzzles", out.getvalue())
+
+        existing_room.refresh_from_db()
+        self.assertEqual(existing_room.text_channel_id, "existing")
+        for puzzle in self.puzzles[1:]:
+            room = ChatRoom.objects.get(pk=puzzle.chat_room.pk)
+            self.assertIn(room.text_channel_id, self.fake_service.text_channels)
+            self.assertEqual(
+                room.text_channel_category,
+                self.hunt.settings.discord_unassigned_text_category,
+            )
+            self.assertIn(
+                f"**{puzzle.name}** has been created!", self.fake_service.messages
+            )
+
+    def test_rejects_nonpositive_concurrency(self):
+        for concurrency in (0, -1):
+            with self.assertRaises(CommandError):
+                call_command(
+                    "createhuntchannels", self.hunt.slug, concurrency=concurrency
+                )
+        for puzzle in self.puzzles:
+            puzzle.chat_room.refresh_from_db()
+            self.assertIsNone(puzzle.chat_room.text_channel_id)
+
+
 class TestChatService(TestCase):
     def test_base_chat_service_constructor_raises_error(self):
         with self.assertRaises(NotImplementedError):
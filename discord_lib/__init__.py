@@ -1 +1,2 @@
+from .async_discord_chat_service import AsyncDiscordChatService
 from .discord_chat_service import DiscordChatService
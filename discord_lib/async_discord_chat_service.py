@@ -0,0 +1,193 @@
+import asyncio
+import logging
+
+import aiohttp
+from django.conf import settings
+
+from .discord_chat_service import (
+    CHANNEL_CATEGORY_TYPE,
+    CHANNEL_TEXT_TYPE,
+    DiscordChatService,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDiscordChatService:
+    """asyncio counterpart of DiscordChatService for bulk channel operations.
+
+    Exposes channel creation and messaging as coroutines so that setting up
+    many puzzles at once (see the createhuntchannels command) doesn't wait on
+    one round-trip at a time. Everything else goes through DiscordChatService.
+
+    This service should be registered in Django settings under
+    CHAT_ASYNC_SERVICES with the same key as its DiscordChatService
+    counterpart in CHAT_SERVICES.
+
+    Each guild's channels are fetched once per run and then kept up to date
+    locally as channels are created, so picking a category doesn't cost a
+    round-trip per channel. A run ends at `close()`.
+
+    The underlying aiohttp session is bound to the event loop it was created
+    in, so callers must `await close()` before that loop finishes.
+    """
+
+    __instance = None
+
+    def __init__(self, settings, max_channels_per_category=50):
+        """Accepts Django settings object."""
+        self._headers = {
+            "Authorization": f"Bot {settings.DISCORD_API_TOKEN}",
+            "Content-Type": "application/json",
+        }
+        self._max_channels_per_category = max_channels_per_category
+        self._session = None
+        self._guild_channels = {}
+        self._guild_locks = {}
+
+    @classmethod
+    def get_instance(cls):
+        if cls.__instance is None:
+            cls.__instance = cls(settings)
+        return cls.__instance
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers=self._headers,
+                timeout=aiohttp.ClientTimeout(total=5),
+            )
+        return self._session
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        self._guild_channels = {}
+        self._guild_locks = {}
+
+    def _guild_lock(self, guild_id):
+        # Picking a category and counting a new channel in it must not
+        # interleave with another coroutine doing the same, or concurrent
+        # creations could duplicate the category or overfill it.
+        return self._guild_locks.setdefault(guild_id, asyncio.Lock())
+
+    async def send_message(self, channel_id, msg, embedded_urls=None):
+        """
+        Sends msg to specified channel_id.
+        embedded_urls is a map mapping display_text to url.
+        e.g. { "Join voice channel": "https://discord.gg/XXX" }
+        """
+        try:
+            async with self._get_session().post(
+                DiscordChatService._channel_messages_url(channel_id),
+                json=DiscordChatService._message_json(msg, embedded_urls),
+            ):
+                pass
+        except Exception:
+            logger.exception("Error sending discord message")
+
+    async def create_text_channel(self, guild_id, name, text_category_name="text"):
+        if not guild_id:
+            raise Exception("Missing guild_id")
+
+        return await self._create_channel(
+            guild_id,
+            name,
+            chan_type=CHANNEL_TEXT_TYPE,
+            parent_name=text_category_name,
+        )
+
+    async def _reserve_category_slot(self, guild_id, category_name, name, chan_type):
+        """
+        Returns a placeholder for channel name in the guild's channel list, under
+        a category named category_name that has fewer than
+        _max_channels_per_category channels. If none exists, a new one is
+        created. Returns None if no category could be found or created.
+        """
+        async with self._guild_lock(guild_id):
+            all_channels = self._guild_channels.get(guild_id)
+            if all_channels is None:
+                all_channels = await self._get_channels_for_guild(guild_id)
+                if not isinstance(all_channels, list):
+                    return None
+                self._guild_channels[guild_id] = all_channels
+
+            category_id = DiscordChatService._find_category_with_room(
+                all_channels, category_name, self._max_channels_per_category
+            )
+            if category_id is None:
+                category_id = await self._create_channel_impl(
+                    guild_id,
+                    category_name,
+                    CHANNEL_CATEGORY_TYPE,
+                    parent_id=None,
+                )
+                if category_id is None:
+                    return None
+                all_channels.append(
+                    {
+                        "id": category_id,
+                        "name": category_name,
+                        "type": CHANNEL_CATEGORY_TYPE,
+                    }
+                )
+
+            channel = {
+                "id": None,
+                "name": name,
+                "type": chan_type,
+                "parent_id": category_id,
+            }
+            all_channels.append(channel)
+            return channel
+
+    async def _create_channel_impl(self, guild_id, name, chan_type, parent_id=None):
+        """
+        Returns channel id
+        """
+        try:
+            async with self._get_session().post(
+                DiscordChatService._guild_channels_url(guild_id),
+                json=DiscordChatService._channel_json(name, chan_type, parent_id),
+            ) as response:
+                json_dict = await response.json(content_type=None)
+            return DiscordChatService._created_channel_id(name, json_dict)
+        except Exception:
+            logger.exception("Error creating channel")
+
+    async def _create_channel(self, guild_id, name, chan_type, parent_name=None):
+        """
+        Returns channel id
+        """
+        if not parent_name:
+            return await self._create_channel_impl(guild_id, name, chan_type)
+        # Use a Discord category as the parent folder for this channel. Only
+        # picking the category is serialized; the channel itself is created
+        # concurrently with others.
+        channel = await self._reserve_category_slot(
+            guild_id, parent_name, name, chan_type
+        )
+        if channel is None:
+            logger.error("Unable to get category %s for %s", parent_name, name)
+            return None
+        channel["id"] = await self._create_channel_impl(
+            guild_id, name, chan_type, channel["parent_id"]
+        )
+        if channel["id"] is None:
+            # Give the slot back to the category.
+            self._guild_channels[guild_id].remove(channel)
+        return channel["id"]
+
+    async def _get_channels_for_guild(self, guild_id):
+        if not guild_id:
+            raise Exception("Missing guild_id")
+        try:
+            async with self._get_session().get(
+                DiscordChatService._guild_channels_url(guild_id),
+            ) as response:
+                return await response.json(content_type=None)
+        except Exception:
+            logger.exception("Error getting channels from discord")
+
+    create_channel_url = DiscordChatService.create_channel_url
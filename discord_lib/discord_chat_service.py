@@ -1,11 +1,16 @@
-import json
+import logging
 from collections import defaultdict
+from functools import lru_cache
 from typing import List, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from chat.service import ChatService
 
+logger = logging.getLogger(__name__)
+
 DISCORD_BASE_API_URL = "https://discord.com/api"
 
 CHANNEL_CATEGORY_TYPE = 4
@@ -13,6 +18,25 @@ CHANNEL_TEXT_TYPE = 0
 CHANNEL_VOICE_TYPE = 2
 
 
+@lru_cache(maxsize=128)
+def _make_link_embeds_frozen(embedded_url_items):
+    """
+    Builds link embeds from a tuple of (display_text, url) pairs. Results are
+    shared between callers (e.g. a channel message and its announcement), so
+    they must not be mutated.
+    """
+    fields = [
+        {
+            "name": text,
+            "value": f"[link]({url})",
+            "inline": True,
+        }
+        for text, url in embedded_url_items
+    ]
+    # 12852794 is Cardinal
+    return [{"fields": fields, "color": 12852794, "type": "rich"}]
+
+
 class DiscordChatService(ChatService):
     """Discord service proxy.
 
@@ -22,46 +46,77 @@ class DiscordChatService(ChatService):
 
     def __init__(self, settings, max_channels_per_category=50):
         """Accepts Django settings object and optional Discord APIClient (for testing)."""
-        self._headers = {
-            "Authorization": f"Bot {settings.DISCORD_API_TOKEN}",
-            "Content-Type": "application/json",
-        }
+        # A shared session keeps the TLS connection to Discord alive between calls.
+        # Retries only apply to idempotent methods, so POSTs are never repeated.
+        self._session = requests.Session()
+        self._session.headers.update(
+            {
+                "Authorization": f"Bot {settings.DISCORD_API_TOKEN}",
+                "Content-Type": "application/json",
+            }
+        )
+        adapter = HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=20,
+            max_retries=Retry(
+                total=3,
+                backoff_factor=0.3,
+                status_forcelist=[429, 500, 502, 503, 504],
+                raise_on_status=False,
+            ),
+        )
+        self._session.mount("https://", adapter)
         self._max_channels_per_category = max_channels_per_category
 
-    def _make_link_embeds(self, embedded_urls):
+    @staticmethod
+    def _make_link_embeds(embedded_urls):
         if not embedded_urls:
             return None
-        fields = [
-            {
-                "name": text,
-                "value": f"[link]({url})",
-                "inline": True,
-            }
-            for text, url in embedded_urls.items()
-        ]
-        if not len(fields):
-            return None
-        # 12852794 is Cardinal
-        return [{"fields": fields, "color": 12852794, "type": "rich"}]
+        return _make_link_embeds_frozen(tuple(embedded_urls.items()))
+
+    # URL, request body and response helpers shared with AsyncDiscordChatService.
+
+    @staticmethod
+    def _channel_messages_url(channel_id):
+        return f"{DISCORD_BASE_API_URL}/channels/{channel_id}/messages"
+
+    @staticmethod
+    def _guild_channels_url(guild_id):
+        return f"{DISCORD_BASE_API_URL}/guilds/{guild_id}/channels"
+
+    @classmethod
+    def _message_json(cls, msg, embedded_urls):
+        return {"content": msg, "embeds": cls._make_link_embeds(embedded_urls)}
+
+    @staticmethod
+    def _channel_json(name, chan_type, parent_id=None):
+        return {"name": name, "type": chan_type, "parent_id": parent_id}
+
+    @staticmethod
+    def _created_channel_id(name, json_dict):
+        """
+        Returns the channel id from a create channel response, or None
+        """
+        if "id" in json_dict:
+            return json_dict["id"]
+        logger.error("Unable to create channel %s: %s", name, json_dict)
 
-    def send_message(self, channel_id, msg, embedded_urls={}):
+    def send_message(self, channel_id, msg, embedded_urls=None):
         """
         Sends msg to specified channel_id.
         embedded_urls is a map mapping display_text to url.
         e.g. { "Join voice channel": "https://discord.gg/XXX" }
         """
         try:
-            embeds = self._make_link_embeds(embedded_urls)
-            requests.post(
-                f"{DISCORD_BASE_API_URL}/channels/{channel_id}/messages",
-                headers=self._headers,
-                json={"content": msg, "embeds": embeds},
+            self._session.post(
+                self._channel_messages_url(channel_id),
+                json=self._message_json(msg, embedded_urls),
                 timeout=5,
             )
-        except Exception as e:
-            print(f"Error sending discord message: {e}")
+        except Exception:
+            logger.exception("Error sending discord message")
 
-    def announce(self, puzzle_announcements_id, msg, embedded_urls={}):
+    def announce(self, puzzle_announcements_id, msg, embedded_urls=None):
         if puzzle_announcements_id:
             self.send_message(puzzle_announcements_id, msg, embedded_urls)
         return
@@ -79,18 +134,17 @@ class DiscordChatService(ChatService):
 
     def get_text_channel_participants(self, channel_id) -> Optional[List[str]]:
         try:
-            response = requests.get(
-                f"{DISCORD_BASE_API_URL}/channels/{channel_id}/messages",
-                headers=self._headers,
+            response = self._session.get(
+                self._channel_messages_url(channel_id),
                 timeout=5,
             )
-            messages = json.loads(response.content.decode("utf-8"))
+            messages = response.json()
             usernames = [
                 m["author"]["username"] for m in messages if not m["author"]["bot"]
             ]
             return list(set(usernames))
-        except Exception as e:
-            print(f"Error getting channel messages: {e}")
+        except Exception:
+            logger.exception("Error getting channel messages")
 
     def delete_text_channel(self, channel_id):
         self.delete_channel(channel_id)
@@ -107,13 +161,12 @@ class DiscordChatService(ChatService):
 
     def delete_channel(self, channel_id):
         try:
-            requests.delete(
+            self._session.delete(
                 f"{DISCORD_BASE_API_URL}/channels/{channel_id}",
-                headers=self._headers,
                 timeout=5,
             )
-        except Exception as e:
-            print(f"Error deleting channel: {e}")
+        except Exception:
+            logger.exception("Error deleting channel")
 
     def _get_or_create_category(self, guild_id, category_name):
         """
@@ -121,6 +174,27 @@ class DiscordChatService(ChatService):
         exists, a new one is created.
         """
         all_channels = self._get_channels_for_guild(guild_id)
+        category_id = self._find_category_with_room(
+            all_channels, category_name, self._max_channels_per_category
+        )
+        if category_id is not None:
+            return category_id
+
+        return self._create_channel_impl(
+            guild_id,
+            category_name,
+            CHANNEL_CATEGORY_TYPE,
+            parent_id=None,
+        )
+
+    @staticmethod
+    def _find_category_with_room(
+        all_channels, category_name, max_channels_per_category
+    ):
+        """
+        Returns id of a category named category_name with fewer than
+        max_channels_per_category children, or None.
+        """
         num_children_per_parent = defaultdict(int)
         category_channels = []
         for c in all_channels:
@@ -130,33 +204,23 @@ class DiscordChatService(ChatService):
                 num_children_per_parent[c["parent_id"]] += 1
 
         for parent in category_channels:
-            if num_children_per_parent[parent["id"]] < self._max_channels_per_category:
+            if num_children_per_parent[parent["id"]] < max_channels_per_category:
                 return parent["id"]
-
-        return self._create_channel_impl(
-            guild_id,
-            category_name,
-            CHANNEL_CATEGORY_TYPE,
-            parent_id=None,
-        )
+        return None
 
     def _create_channel_impl(self, guild_id, name, chan_type, parent_id=None):
         """
         Returns channel id
         """
         try:
-            response = requests.post(
-                f"{DISCORD_BASE_API_URL}/guilds/{guild_id}/channels",
-                headers=self._headers,
-                json={"name": name, "type": chan_type, "parent_id": parent_id},
+            response = self._session.post(
+                self._guild_channels_url(guild_id),
+                json=self._channel_json(name, chan_type, parent_id),
                 timeout=5,
             )
-            json_dict = json.loads(response.content.decode("utf-8"))
-            if "id" in json_dict:
-                return json_dict["id"]
-            print(f"Unable to create channel")
-        except Exception as e:
-            print(f"Error creating channel: {e}")
+            return self._created_channel_id(name, response.json())
+        except Exception:
+            logger.exception("Error creating channel")
 
     def _create_channel(self, guild_id, name, chan_type, parent_name=None):
         """
@@ -166,69 +230,78 @@ class DiscordChatService(ChatService):
         if parent_name:
             # Use a Discord category as the parent folder for this channel.
             parent_id = self._get_or_create_category(guild_id, parent_name)
+            if parent_id is None:
+                logger.error("Unable to get category %s for %s", parent_name, name)
+                return None
         return self._create_channel_impl(guild_id, name, chan_type, parent_id)
 
     def _modify_channel_parent(self, channel_id, parent_id):
+        """
+        Returns whether the channel is now under parent_id
+        """
         try:
-            requests.patch(
+            response = self._session.patch(
                 f"{DISCORD_BASE_API_URL}/channels/{channel_id}",
-                headers=self._headers,
                 json={
                     "parent_id": parent_id,
                 },
                 timeout=5,
             )
-        except Exception as e:
-            print(f"Error categorizing channel: {e}")
+            channel = response.json()
+            if response.ok and channel.get("parent_id") == parent_id:
+                return True
+            logger.error("Unable to categorize channel %s: %s", channel_id, channel)
+        except Exception:
+            logger.exception("Error categorizing channel")
+        return False
 
     def categorize_channel(self, guild_id, channel_id, category_name):
         if not guild_id or not channel_id:
             raise Exception("Missing guild_id or channel_id")
         parent_id = self._get_or_create_category(guild_id, category_name)
-        self._modify_channel_parent(channel_id, parent_id)
-        return
+        if parent_id is None:
+            logger.error("Unable to get category %s", category_name)
+            return False
+        return self._modify_channel_parent(channel_id, parent_id)
 
     def archive_channel(self, guild_id, channel_id, discord_archive_category="archive"):
-        self.categorize_channel(guild_id, channel_id, discord_archive_category)
+        return self.categorize_channel(guild_id, channel_id, discord_archive_category)
 
     def unarchive_text_channel(self, guild_id, channel_id, text_category_name="text"):
-        self.categorize_channel(guild_id, channel_id, text_category_name)
+        return self.categorize_channel(guild_id, channel_id, text_category_name)
 
     def unarchive_voice_channel(
         self, guild_id, channel_id, voice_category_name="voice"
     ):
-        self.categorize_channel(guild_id, channel_id, voice_category_name)
+        return self.categorize_channel(guild_id, channel_id, voice_category_name)
 
     def _get_channels_for_guild(self, guild_id):
         if not guild_id:
             raise Exception("Missing guild_id")
         try:
-            response = requests.get(
-                f"{DISCORD_BASE_API_URL}/guilds/{guild_id}/channels",
-                headers=self._headers,
+            response = self._session.get(
+                self._guild_channels_url(guild_id),
                 timeout=5,
             )
-            channels = json.loads(response.content.decode("utf-8"))
-            return channels
-        except Exception as e:
-            print(f"Error getting channels from discord: {e}")
+            return response.json()
+        except Exception:
+            logger.exception("Error getting channels from discord")
 
     def _create_channel_invite(self, channel_id, max_age=0):
         """
         Returns invite code
         """
         try:
-            response = requests.post(
+            response = self._session.post(
                 f"{DISCORD_BASE_API_URL}/channels/{channel_id}/invites",
-                headers=self._headers,
                 json={"max_age": max_age},
                 timeout=5,
             )
-            json_dict = json.loads(response.content.decode("utf-8"))
+            json_dict = response.json()
             if "code" in json_dict:
                 return json_dict["code"]
-        except Exception as e:
-            print(f"Error creating discord invite: {e}")
+        except Exception:
+            logger.exception("Error creating discord invite")
 
     def create_channel_url(self, guild_id, channel_id, is_audio=False):
         if not guild_id or not channel_id:
@@ -256,33 +329,30 @@ class DiscordChatService(ChatService):
 
     def handle_puzzle_rename(self, channel_id, new_name):
         try:
-            requests.patch(
+            self._session.patch(
                 f"{DISCORD_BASE_API_URL}/channels/{channel_id}",
-                headers=self._headers,
                 json={
                     "name": new_name,
                 },
                 timeout=5,
             )
-        except Exception as e:
-            print(f"Error renaming channel: {e}")
+        except Exception:
+            logger.exception("Error renaming channel")
 
     def get_all_roles(self, guild_id):
         try:
-            response = requests.get(
+            response = self._session.get(
                 f"{DISCORD_BASE_API_URL}/guilds/{guild_id}/roles",
-                headers=self._headers,
                 timeout=5,
             )
-            return json.loads(response.content.decode("utf-8"))
-        except Exception as e:
-            print(f"Error getting roles from Discord: {e}")
+            return response.json()
+        except Exception:
+            logger.exception("Error getting roles from Discord")
 
     def create_role(self, guild_id, role_name, color):
         try:
-            response = requests.post(
+            response = self._session.post(
                 f"{DISCORD_BASE_API_URL}/guilds/{guild_id}/roles",
-                headers=self._headers,
                 json={
                     "name": role_name,
                     "color": color,
@@ -290,6 +360,6 @@ class DiscordChatService(ChatService):
                 },
                 timeout=5,
             )
-            return json.loads(response.content.decode("utf-8"))
-        except Exception as e:
-            print(f"Error creating Discord role: {e}")
+            return response.json()
+        except Exception:
+            logger.exception("Error creating Discord role")
@@ -0,0 +1,171 @@
+import asyncio
+import itertools
+from unittest.mock import Mock, patch
+
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+
+from .async_discord_chat_service import AsyncDiscordChatService
+from .discord_chat_service import (
+    CHANNEL_CATEGORY_TYPE,
+    DISCORD_BASE_API_URL,
+    DiscordChatService,
+)
+
+TEST_GUILD_ID = "guild"
+FAKE_LATENCY = 0.01
+
+
+class FakeAsyncResponse:
+    def __init__(self, session, json_data):
+        self._session = session
+        self._json_data = json_data
+
+    async def __aenter__(self):
+        self._session.in_flight += 1
+        self._session.max_in_flight = max(
+            self._session.max_in_flight, self._session.in_flight
+        )
+        # Take a while, like a real round-trip, so concurrent requests overlap.
+        await asyncio.sleep(FAKE_LATENCY)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._session.in_flight -= 1
+
+    async def json(self, content_type=None):
+        return self._json_data
+
+
+class FakeAsyncDiscordSession:
+    """Stands in for the aiohttp session, backed by an in-memory guild."""
+
+    def __init__(self):
+        self.channels = []
+        self.messages = []
+        self.guild_channel_fetches = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._ids = itertools.count()
+
+    def get(self, url):
+        if url == f"{DISCORD_BASE_API_URL}/guilds/{TEST_GUILD_ID}/channels":
+            self.guild_channel_fetches += 1
+            return FakeAsyncResponse(self, [dict(c) for c in self.channels])
+        return FakeAsyncResponse(self, {})
+
+    def post(self, url, json):
+        if url == f"{DISCORD_BASE_API_URL}/guilds/{TEST_GUILD_ID}/channels":
+            channel = dict(json, id=str(next(self._ids)), guild_id=TEST_GUILD_ID)
+            self.channels.append(channel)
+            return FakeAsyncResponse(self, dict(channel))
+        self.messages.append((url, json))
+        return FakeAsyncResponse(self, {})
+
+
+@override_settings(DISCORD_API_TOKEN="token")
+class TestDiscordChatService(SimpleTestCase):
+    def setUp(self):
+        self.service = DiscordChatService(settings)
+        self.service._session = Mock()
+
+    def test_categorize_channel_reports_whether_channel_moved(self):
+        response = self.service._session.patch.return_value
+        response.ok = True
+        with patch.object(
+            self.service, "_get_or_create_category", return_value="category"
+        ):
+            response.json.return_value = {"id": "channel", "parent_id": "category"}
+            self.assertTrue(
+                self.service.categorize_channel(TEST_GUILD_ID, "channel", "text")
+            )
+
+            response.json.return_value = {"message": "Missing Permissions"}
+            response.ok = False
+            self.assertFalse(
+                self.service.categorize_channel(TEST_GUILD_ID, "channel", "text")
+            )
+
+    def test_missing_category_skips_channel_requests(self):
+        with patch.object(self.service, "_get_or_create_category", return_value=None):
+            self.assertFalse(
+                self.service.categorize_channel(TEST_GUILD_ID, "channel", "text")
+            )
+            self.assertIsNone(
+                self.service.create_text_channel(TEST_GUILD_ID, "puzzle", "text")
+            )
+        self.service._session.patch.assert_not_called()
+        self.service._session.post.assert_not_called()
+
+
+@override_settings(DISCORD_API_TOKEN="token")
+class TestAsyncDiscordChatService(SimpleTestCase):
+    def setUp(self):
+        self.session = FakeAsyncDiscordSession()
+        self.service = AsyncDiscordChatService(settings)
+        self.service._get_session = lambda: self.session
+
+    async def test_concurrent_creates_share_one_category(self):
+        channel_ids = await asyncio.gather(
+            *[
+                self.service.create_text_channel(TEST_GUILD_ID, f"puzzle {i}", "text")
+                for i in range(5)
+            ]
+        )
+        await self.service.close()
+
+        categories = [
+            c for c in self.session.channels if c["type"] == CHANNEL_CATEGORY_TYPE
+        ]
+        self.assertEqual(len(categories), 1)
+        self.assertEqual(categories[0]["name"], "text")
+        for channel in self.session.channels:
+            if channel["id"] in channel_ids:
+                self.assertEqual(channel["parent_id"], categories[0]["id"])
+
+    async def test_concurrent_creates_in_one_category_overlap(self):
+        await asyncio.gather(
+            *[
+                self.service.create_text_channel(TEST_GUILD_ID, f"puzzle {i}", "text")
+                for i in range(5)
+            ]
+        )
+        await self.service.close()
+
+        self.assertEqual(self.session.guild_channel_fetches, 1)
+        self.assertEqual(self.session.max_in_flight, 5)
+
+    async def test_concurrent_creates_respect_category_limit(self):
+        self.service._max_channels_per_category = 2
+        await asyncio.gather(
+            *[
+                self.service.create_text_channel(TEST_GUILD_ID, f"puzzle {i}", "text")
+                for i in range(5)
+            ]
+        )
+        await self.service.close()
+
+        categories = [
+            c["id"] for c in self.session.channels if c["type"] == CHANNEL_CATEGORY_TYPE
+        ]
+        children = [c["parent_id"] for c in self.session.channels]
+        self.assertEqual(len(categories), 3)
+        for category_id in categories:
+            self.assertLessEqual(children.count(category_id), 2)
+
+    async def test_send_message_embeds_urls(self):
+        embedded_urls = {"Sheet": "https://sheet.com"}
+        await self.service.send_message("channel", "msg", embedded_urls)
+
+        self.assertEqual(
+            self.session.messages,
+            [
+                (
+                    f"{DISCORD_BASE_API_URL}/channels/channel/messages",
+                    {
+                        "content": "msg",
+                        "embeds": DiscordChatService._make_link_embeds(embedded_urls),
+                    },
+                )
+            ],
+        )